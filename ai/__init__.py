@@ -1,4 +1,7 @@
 from .models import File
 from .models import FileAPIResponse
+from .models import MigrationAPIRequest
 from .db.vector import VectorStore
 from .reader import FileProcessor
+from .context import ContextAssembler
+from .executor import ExecutionPolicy
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Context Compaction Benchmark
+Compares the prompt size of raw search hits against the token-budgeted
+/api/context assembly of those same hits for a set of queries against one
+project.
+
+Usage: python bench_context.py <project_id> "query one" "query two" ...
+"""
+
+import argparse
+import time
+
+import requests
+from rich.console import Console
+from rich.table import Table
+
+console = Console()
+
+
+def run(
+    ai_base_url: str, project_id: str, queries: list[str], token_budget: int, limit: int
+):
+    table = Table(title=f"Context compaction (budget: {token_budget} tokens, {limit} hits)")
+    table.add_column("Query", style="cyan", max_width=40)
+    table.add_column("Raw tokens", style="magenta", justify="right")
+    table.add_column("Context tokens", style="green", justify="right")
+    table.add_column("Saved", style="yellow", justify="right")
+    table.add_column("Vector ms", justify="right")
+    table.add_column("Context ms", justify="right")
+
+    total_raw = total_context = 0
+    for query in queries:
+        params = {"query": query, "project_id": project_id}
+
+        start = time.perf_counter()
+        response = requests.get(f"{ai_base_url}/api/vector", params=params, timeout=60)
+        response.raise_for_status()
+        vector_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        response = requests.get(
+            f"{ai_base_url}/api/context",
+            params={**params, "token_budget": token_budget, "limit": limit},
+            timeout=60,
+        )
+        response.raise_for_status()
+        context_ms = (time.perf_counter() - start) * 1000
+        data = response.json()
+
+        # raw_tokens covers the same hits before merging and packing, so the
+        # difference is what compaction saved on this retrieval set
+        total_raw += data["raw_tokens"]
+        total_context += data["tokens"]
+        table.add_row(
+            query,
+            str(data["raw_tokens"]),
+            str(data["tokens"]),
+            str(data["raw_tokens"] - data["tokens"]),
+            f"{vector_ms:.1f}",
+            f"{context_ms:.1f}",
+        )
+
+    console.print(table)
+    if queries:
+        saved = (total_raw - total_context) / len(queries)
+        console.print(f"Mean tokens saved per query: [bold]{saved:.1f}[/bold]")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("project_id")
+    parser.add_argument("queries", nargs="+")
+    parser.add_argument("--ai-url", default="http://localhost:8000")
+    parser.add_argument("--token-budget", type=int, default=1024)
+    # Matches the number of hits /api/vector returns
+    parser.add_argument("--limit", type=int, default=5)
+    args = parser.parse_args()
+
+    try:
+        run(args.ai_url, args.project_id, args.queries, args.token_budget, args.limit)
+    except requests.exceptions.RequestException as e:
+        console.print(f"[red]✗ Error:[/red] {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Mixed-Load Benchmark
+Measures search latency while large ingests run concurrently, along with
+how long those ingests take (alone on an idle server and under mixed
+load). Run it once against a server started normally and once with
+EXECUTION_POLICY=0 to compare both with and without the execution policy.
+
+Usage: python bench_executor.py --ingests 4 --queries 200
+"""
+
+import argparse
+import base64
+import math
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from rich.console import Console
+from rich.table import Table
+
+console = Console()
+
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[math.ceil(p * len(values)) - 1] if values else 0.0
+
+
+def ingest(ai_base_url: str, project_id: str, paragraphs: int) -> float:
+    text = "\n\n".join(
+        f"Paragraph {i}: " + " ".join(f"token{i}_{j}" for j in range(120))
+        for i in range(paragraphs)
+    )
+    start = time.perf_counter()
+    response = requests.post(
+        f"{ai_base_url}/api/process",
+        json={
+            "content": base64.b64encode(text.encode("utf-8")).decode("ascii"),
+            "filename": "bench.txt",
+            "document_id": str(uuid.uuid4()),
+            "project_id": project_id,
+        },
+        timeout=600,
+    )
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+def run(ai_base_url: str, ingests: int, queries: int, paragraphs: int):
+    project_id = f"bench-{uuid.uuid4()}"
+    latencies: list[float] = []
+    done = threading.Event()
+
+    # Seed one small document so searches have something to hit
+    ingest(ai_base_url, project_id, 10)
+    # One large ingest with nothing else running, to show idle throughput
+    idle_ingest = ingest(ai_base_url, project_id, paragraphs)
+
+    mixed_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=ingests) as pool:
+        futures = [
+            pool.submit(ingest, ai_base_url, project_id, paragraphs)
+            for _ in range(ingests)
+        ]
+
+        def wait_for_ingests():
+            for future in futures:
+                future.exception()
+            done.set()
+
+        # Keep querying only while ingests are still running
+        threading.Thread(target=wait_for_ingests, daemon=True).start()
+
+        for i in range(queries):
+            if done.is_set():
+                break
+            start = time.perf_counter()
+            response = requests.get(
+                f"{ai_base_url}/api/vector",
+                params={"query": f"token{i % paragraphs}_1", "project_id": project_id},
+                timeout=600,
+            )
+            response.raise_for_status()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    mixed_wall = time.perf_counter() - mixed_start
+    ingest_times = [future.result() for future in futures]
+
+    stats = requests.get(f"{ai_base_url}/api/debug/executor", timeout=10).json()
+    requests.delete(
+        f"{ai_base_url}/api/vector", params={"project_id": project_id}, timeout=60
+    )
+
+    table = Table(title="Query latency under concurrent ingest")
+    table.add_column("Metric", style="cyan")
+    table.add_column("Value", style="green", justify="right")
+    table.add_row("Execution policy", str(stats.get("enabled")))
+    table.add_row("Queries measured", str(len(latencies)))
+    table.add_row("p50 (ms)", f"{percentile(latencies, 0.5):.1f}")
+    table.add_row("p99 (ms)", f"{percentile(latencies, 0.99):.1f}")
+    table.add_row("Max (ms)", f"{max(latencies, default=0.0):.1f}")
+    table.add_row("Idle ingest (s)", f"{idle_ingest:.2f}")
+    table.add_row(
+        "Mixed ingest mean (s)", f"{sum(ingest_times) / len(ingest_times):.2f}"
+    )
+    table.add_row("Mixed ingest max (s)", f"{max(ingest_times):.2f}")
+    table.add_row("Mixed phase wall time (s)", f"{mixed_wall:.2f}")
+    console.print(table)
+    console.print_json(data=stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ai-url", default="http://localhost:8000")
+    parser.add_argument("--ingests", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--paragraphs", type=int, default=400)
+    args = parser.parse_args()
+
+    try:
+        run(args.ai_url, args.ingests, args.queries, args.paragraphs)
+    except requests.exceptions.RequestException as e:
+        console.print(f"[red]✗ Error:[/red] {e}")
+
+
+if __name__ == "__main__":
+    main()
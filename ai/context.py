@@ -0,0 +1,145 @@
+import math
+from typing import Any, Dict, List
+
+# Rough characters-per-token ratio for English text. The chat model's
+# tokenizer lives in Ollama, so the budget is enforced with an estimate.
+CHARS_PER_TOKEN = 4
+# Shorter suffix/prefix matches between chunks without offsets are treated
+# as coincidence rather than splitter overlap.
+MIN_TEXT_OVERLAP = 32
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+class _Span:
+    def __init__(self, hit: Dict[str, Any]):
+        self.document_id = hit.get("document_id")
+        self.text: str = hit.get("text") or ""
+        self.score: float = hit.get("_distance", 0.0)
+        self.first_index = hit.get("chunk_index")
+        self.last_index = self.first_index
+        self.start = hit.get("start_offset")
+        self.end = self.start + len(self.text) if self.start is not None else None
+        self.chunks = 1
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.text)
+
+    def _suffix_overlap(self, text: str) -> int:
+        # Longest suffix of our text that is a prefix of the next chunk
+        for size in range(min(len(self.text), len(text)), MIN_TEXT_OVERLAP - 1, -1):
+            if self.text.endswith(text[:size]):
+                return size
+        return 0
+
+    def try_merge(self, other: "_Span") -> bool:
+        if self.first_index is None or other.first_index is None:
+            return False
+
+        if self.end is not None and other.start is not None:
+            if other.start <= self.end:
+                # Overlapping ranges: only keep what extends past our end
+                self.text += other.text[self.end - other.start :]
+                self.end = max(self.end, other.start + len(other.text))
+            elif other.first_index == self.last_index + 1:
+                # Neighbouring chunks separated only by splitter whitespace
+                self.text += "\n" + other.text
+                self.end = other.end
+            else:
+                return False
+        elif other.first_index == self.last_index + 1:
+            overlap = self._suffix_overlap(other.text)
+            if overlap:
+                self.text += other.text[overlap:]
+            else:
+                # No real overlap, as with neighbours separated by whitespace
+                self.text += "\n" + other.text
+            # Our end is no longer known, so later merges use text overlap too
+            self.end = None
+        else:
+            return False
+
+        self.last_index = max(self.last_index, other.last_index)
+        self.score = min(self.score, other.score)
+        self.chunks += other.chunks
+        return True
+
+
+class ContextAssembler:
+    """Builds a token-budgeted LLM context from raw vector search hits.
+
+    Hits from the same document are merged when they are adjacent or overlap,
+    dropping the text repeated by the splitter's chunk overlap. The most
+    relevant spans are packed into the budget and returned grouped by
+    document in reading order.
+    """
+
+    def __init__(self, token_budget: int = 1024):
+        self.token_budget = token_budget
+
+    def _merge(self, hits: List[Dict[str, Any]]) -> List[_Span]:
+        by_document: Dict[Any, List[_Span]] = {}
+        seen = set()
+        for hit in hits:
+            key = (hit.get("document_id"), hit.get("text"))
+            if key in seen:
+                continue
+            seen.add(key)
+            by_document.setdefault(hit.get("document_id"), []).append(_Span(hit))
+
+        merged: List[_Span] = []
+        for spans in by_document.values():
+            # Rows ingested before chunk metadata existed sort last, unmerged
+            spans.sort(
+                key=lambda s: (
+                    s.first_index is None,
+                    s.first_index if s.first_index is not None else 0,
+                )
+            )
+            current = spans[0]
+            for span in spans[1:]:
+                if not current.try_merge(span):
+                    merged.append(current)
+                    current = span
+            merged.append(current)
+
+        return merged
+
+    def assemble(self, hits: List[Dict[str, Any]]) -> Dict[str, Any]:
+        spans = self._merge(hits)
+
+        selected: List[_Span] = []
+        remaining = self.token_budget
+        for span in sorted(spans, key=lambda s: s.score):
+            if span.tokens <= remaining:
+                selected.append(span)
+                remaining -= span.tokens
+            elif not selected and remaining > 0:
+                # Never return nothing when the best span alone is too large
+                span.text = span.text[: remaining * CHARS_PER_TOKEN]
+                selected.append(span)
+                remaining -= span.tokens
+
+        # Most relevant document first, then reading order within a document
+        document_rank: Dict[Any, int] = {}
+        for span in selected:
+            document_rank.setdefault(span.document_id, len(document_rank))
+        selected.sort(
+            key=lambda s: (
+                document_rank[s.document_id],
+                s.first_index is None,
+                s.first_index if s.first_index is not None else 0,
+            )
+        )
+
+        return {
+            "text": [span.text for span in selected],
+            "tokens": sum(span.tokens for span in selected),
+            "raw_tokens": sum(estimate_tokens(hit.get("text") or "") for hit in hits),
+            "chunks": sum(span.chunks for span in selected),
+        }
@@ -1 +1,2 @@
 from .vector import VectorStore
+from .migration import EmbeddingMigration
@@ -0,0 +1,244 @@
+import threading
+import time
+from typing import TYPE_CHECKING, List
+
+from sentence_transformers import SentenceTransformer
+
+if TYPE_CHECKING:
+    from .vector import VectorStore
+
+
+class EmbeddingMigration:
+    """Online re-embedding of a VectorStore into a new model's table.
+
+    New ingests are dual-written by the store while a background thread
+    re-encodes existing chunks from the stored text column, one document at
+    a time. Between batches the backfill backs off whenever the store's
+    recent query p99 exceeds the budget. Once every document is present in
+    the new table the store switches over to it.
+    """
+
+    def __init__(
+        self,
+        store: "VectorStore",
+        model_name: str,
+        batch_size: int = 64,
+        p99_budget_ms: float = 500.0,
+        min_delay: float = 0.05,
+        max_delay: float = 5.0,
+        resume: bool = False,
+    ):
+        self.store = store
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.p99_budget_ms = p99_budget_ms
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+
+        self.model = SentenceTransformer(model_name)
+        # A leftover target table (cancelled or failed run, or a model used
+        # before) missed deletes made since, so only reuse it when resuming
+        # after a restart; otherwise start from an empty table.
+        self.table = store.open_table(model_name, self.model, overwrite=not resume)
+        self.source = store.table
+
+        self.state = "pending"
+        self.error: str | None = None
+        self.total_rows = 0
+        self.rows_done = 0
+        self.rows_encoded = 0
+        self.delay = min_delay
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+
+        self._cancel = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def running(self) -> bool:
+        return self.state in ("pending", "running")
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name=f"migration-{self.model_name}", daemon=True
+        )
+        self._thread.start()
+
+    def cancel(self):
+        """Stop the backfill and wait for the worker thread to exit.
+
+        The migration keeps reporting as running until then, so a new one
+        cannot rebuild the target table while this thread still writes to it.
+        """
+        self._cancel.set()
+        if self._thread is not None:
+            self._thread.join()
+        elif self.running:
+            self.state = "cancelled"
+
+    def dual_write(
+        self,
+        text_chunks: List[str],
+        document_id: str,
+        project_id,
+        offsets: List[int] | None = None,
+    ):
+        try:
+            embeddings = self.store.encode_batches(self.model, text_chunks)
+            rows = self.store.build_rows(
+                embeddings, text_chunks, document_id, project_id, offsets
+            )
+            with self.store._write_lock:
+                # Skip if the migration ended (the switchover already holds
+                # every source document), the document was backfilled, or it
+                # was deleted while encoding.
+                if not self.running:
+                    return
+                if self.store._entry_exists(document_id, self.table):
+                    return
+                if not self.store._entry_exists(document_id, self.source):
+                    return
+                self.table.add(rows)
+        except Exception as e:
+            print(f"Error dual-writing document {document_id} to {self.model_name}: {e}")
+
+    def _source_documents(self) -> List[str]:
+        documents = self.source.to_lance().to_table(columns=["document_id"])
+        return documents.column("document_id").unique().to_pylist()
+
+    def _missing_documents(self) -> set:
+        target = self.table.to_lance().to_table(columns=["document_id"])
+        return set(self._source_documents()) - set(
+            target.column("document_id").unique().to_pylist()
+        )
+
+    def _prune_deleted(self):
+        # Drop documents that exist only in the target, e.g. deleted from the
+        # source after being backfilled by an interrupted run.
+        target = self.table.to_lance().to_table(columns=["document_id"])
+        stale = set(target.column("document_id").unique().to_pylist())
+        stale -= set(self._source_documents())
+        for document_id in stale:
+            self.table.delete(f"document_id = '{document_id}'")
+        if stale:
+            print(f"Removed {len(stale)} deleted documents from {self.model_name}")
+
+    def _throttle(self):
+        # Exponential backoff while queries are over budget, recovering
+        # towards full speed once they are back under it.
+        p99 = self.store.query_p99_ms()
+        if p99 is not None and p99 > self.p99_budget_ms:
+            self.delay = min(self.delay * 2, self.max_delay)
+        else:
+            self.delay = max(self.delay / 2, self.min_delay)
+        self._cancel.wait(self.delay)
+        if self.store.pause is not None:
+            self.store.pause()
+
+    def _backfill_document(self, document_id: str) -> bool:
+        if self.store._entry_exists(document_id, self.table):
+            # Already dual-written or backfilled before a restart
+            self.rows_done += self.table.count_rows(filter=f"document_id='{document_id}'")
+            return False
+
+        rows = (
+            self.source.to_lance()
+            .to_table(
+                columns=["text", "document_id", "project_id", "chunk_index", "start_offset"],
+                filter=f"document_id = '{document_id}'",
+            )
+            .to_pylist()
+        )
+        rows.sort(key=lambda r: (r["chunk_index"] is None, r["chunk_index"] or 0))
+
+        for start in range(0, len(rows), self.batch_size):
+            if self._cancel.is_set():
+                return False
+            batch = rows[start : start + self.batch_size]
+            embeddings = self.model.encode([r["text"] for r in batch])
+            for row, embedding in zip(batch, embeddings):
+                row["vector"] = embedding.tolist()
+            self.rows_encoded += len(batch)
+            self._throttle()
+
+        with self.store._write_lock:
+            # Skip documents that were dual-written or deleted meanwhile
+            if self.store._entry_exists(document_id, self.table):
+                return False
+            if not self.store._entry_exists(document_id, self.source):
+                return False
+            self.table.add(rows)
+
+        self.rows_done += len(rows)
+        return True
+
+    def _run(self):
+        if self.state == "pending":
+            self.state = "running"
+        self.started_at = time.time()
+        try:
+            self.total_rows = self.source.count_rows()
+            print(f"Backfilling {self.total_rows} chunks into {self.model_name}")
+
+            while not self._cancel.is_set():
+                # Repeat until a pass finds nothing missing, catching
+                # documents ingested while the previous pass was running.
+                backfilled = True
+                while backfilled and not self._cancel.is_set():
+                    backfilled = False
+                    self.rows_done = 0
+                    self.total_rows = self.source.count_rows()
+                    for document_id in self._source_documents():
+                        if self._cancel.is_set():
+                            break
+                        backfilled |= self._backfill_document(document_id)
+
+                if self._cancel.is_set():
+                    break
+
+                # Ingests and deletes take the write lock too, so nothing can
+                # be added to or removed from the source between this check
+                # and the switchover.
+                with self.store._write_lock:
+                    # Checked under the lock so a cancel either stops the
+                    # switchover or arrives after it has happened
+                    if self._cancel.is_set():
+                        break
+                    if self._missing_documents():
+                        # An ingest landed after the last pass; go again
+                        continue
+                    self._prune_deleted()
+                    self.rows_done = self.total_rows = self.table.count_rows()
+                    self.store.complete_migration(self)
+                    self.state = "complete"
+                    return
+
+            self.state = "cancelled"
+            print(f"Migration to {self.model_name} cancelled")
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            print(f"Migration to {self.model_name} failed: {e}")
+        finally:
+            self.finished_at = time.time()
+
+    def status(self) -> dict:
+        elapsed = 0.0
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+
+        return {
+            "target_model": self.model_name,
+            "state": self.state,
+            "error": self.error,
+            "total_rows": self.total_rows,
+            "rows_done": self.rows_done,
+            # Ingests during a pass can push rows_done past the pass's total
+            "progress": min(1.0, self.rows_done / self.total_rows)
+            if self.total_rows
+            else 0.0,
+            "rows_per_second": self.rows_encoded / elapsed if elapsed else 0.0,
+            "elapsed_seconds": elapsed,
+            "throttle_delay_seconds": self.delay,
+            "p99_budget_ms": self.p99_budget_ms,
+        }
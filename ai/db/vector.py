@@ -1,90 +1,272 @@
-from typing import List
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Callable, List
 
 import lancedb
 import pyarrow as pa
 from sentence_transformers import SentenceTransformer
 
+from .migration import EmbeddingMigration
+
+DEFAULT_MODEL = "all-MiniLM-L6-v2"
+# Records the active embedding model (and any in-flight migration) so the
+# store reopens the right table after a restart.
+STATE_FILE = "embedding_model.json"
+# Only searches this recent count towards the p99 the backfill throttles on
+LATENCY_WINDOW_SECONDS = 30.0
+
+
+def table_name_for(model_name: str) -> str:
+    # The original model keeps the original table so existing data is reused
+    if model_name == DEFAULT_MODEL:
+        return "embeddings"
+    return "embeddings_" + re.sub(r"[^a-zA-Z0-9]+", "_", model_name).strip("_").lower()
+
 
 class VectorStore:
     # Vector dimension is derived directly from the SentenceTransformer model
-    # to ensure schema and embedding dimensions always match.
-    def __init__(self, path: str = "data"):
+    # to ensure schema and embedding dimensions always match. Each model gets
+    # its own table because the vector column has a fixed list_size.
+    # `pause` is called between encode batches of background work (ingest,
+    # migration backfill) so it can give way to interactive queries.
+    def __init__(
+        self,
+        path: str = "data",
+        pause: Callable[[], None] | None = None,
+        batch_size: int = 64,
+    ):
         self.path = path
         self.db = lancedb.connect(path)
-        self.table_name = "embeddings"
-        self.model = SentenceTransformer("all-MiniLM-L6-v2")
+        self.pause = pause
+        self.batch_size = batch_size
+
+        # Guards the active model/table so a completed migration swaps
+        # queries over atomically.
+        self._lock = threading.Lock()
+        # Serialises writes into a migration target between dual-writes,
+        # deletes and the backfill.
+        self._write_lock = threading.Lock()
+        self._query_latencies = deque(maxlen=256)
+        self.migration: EmbeddingMigration | None = None
+        # Set while a migration's model loads, so concurrent starts are refused
+        self._migration_starting = False
+
+        state = self._load_state()
+        self._activate(state.get("model", DEFAULT_MODEL))
+        self._migrate_chunk_metadata()
+
+        if state.get("target"):
+            print(f"Resuming embedding migration to {state['target']}")
+            self.start_migration(
+                state["target"], resume=True, **state.get("options", {})
+            )
+
+    def _activate(self, model_name: str, model: SentenceTransformer | None = None):
+        self.model_name = model_name
+        self.model = model or SentenceTransformer(model_name)
+        self.table_name = table_name_for(model_name)
 
         # Get vector dimension directly from the model
         self.vector_dimension = self.model.get_sentence_embedding_dimension()
+        self.pa_schema = self._schema(self.vector_dimension)
+        self.table = self.open_table(model_name, self.model)
 
-        self.pa_schema = pa.schema(
+    def _schema(self, dimension) -> pa.Schema:
+        return pa.schema(
             [
-                pa.field(
-                    "vector", pa.list_(pa.float32(), list_size=self.vector_dimension)
-                ),
+                pa.field("vector", pa.list_(pa.float32(), list_size=dimension)),
                 pa.field("text", pa.string()),
                 pa.field("document_id", pa.string()),
                 pa.field("project_id", pa.string()),
+                # Position of the chunk within its document, used to merge
+                # adjacent and overlapping hits during context assembly.
+                pa.field("chunk_index", pa.int32()),
+                pa.field("start_offset", pa.int64()),
             ]
         )
 
-        self.table = self.db.create_table(
-            self.table_name, schema=self.pa_schema, exist_ok=True
+    def open_table(
+        self, model_name: str, model: SentenceTransformer, overwrite: bool = False
+    ):
+        if overwrite:
+            return self.db.create_table(
+                table_name_for(model_name),
+                schema=self._schema(model.get_sentence_embedding_dimension()),
+                mode="overwrite",
+            )
+        return self.db.create_table(
+            table_name_for(model_name),
+            schema=self._schema(model.get_sentence_embedding_dimension()),
+            exist_ok=True,
         )
 
-    def _entry_exists(self, document_id: str) -> bool:
+    def _load_state(self) -> dict:
+        try:
+            with open(os.path.join(self.path, STATE_FILE), "r", encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            print(f"Error reading embedding model state: {e}")
+            return {}
+
+    def _save_state(self, state: dict):
+        filepath = os.path.join(self.path, STATE_FILE)
         try:
-            count = self.table.count_rows(filter=f"document_id='{document_id}'")
+            # Write then rename so a crash never leaves a truncated state file
+            with open(filepath + ".tmp", "w", encoding="utf-8") as file:
+                json.dump(state, file)
+            os.replace(filepath + ".tmp", filepath)
+        except Exception as e:
+            print(f"Error saving embedding model state: {e}")
+
+    def _migrate_chunk_metadata(self):
+        # Tables created before chunk metadata was stored are missing the
+        # position columns. Add them as nulls; those rows are still searchable
+        # but are never merged with their neighbours.
+        missing = {
+            "chunk_index": "CAST(NULL AS INT)",
+            "start_offset": "CAST(NULL AS BIGINT)",
+        }
+        existing = set(self.table.schema.names)
+        columns = {name: expr for name, expr in missing.items() if name not in existing}
+        if not columns:
+            return
+
+        try:
+            self.table.add_columns(columns)
+            print(f"Added chunk metadata columns: {', '.join(columns)}")
+        except Exception as e:
+            print(f"Error adding chunk metadata columns: {e}")
+
+    def _entry_exists(self, document_id: str, table=None) -> bool:
+        table = table if table is not None else self.table
+        try:
+            count = table.count_rows(filter=f"document_id='{document_id}'")
             return count > 0
         except Exception as e:
             print(f"An unexpected error occured: {e}")
             return False
 
-    def add(self, text_chunks: List[str], document_id: str, project_id):
-        if self._entry_exists(document_id):
-            print(f"Document {document_id} already exists in vector store. Skipping")
-            return None
+    def encode_batches(self, model: SentenceTransformer, text_chunks: List[str]):
+        embeddings = []
+        for start in range(0, len(text_chunks), self.batch_size):
+            if self.pause is not None:
+                self.pause()
+            embeddings.extend(model.encode(text_chunks[start : start + self.batch_size]))
+        return embeddings
 
-        embeddings = self.model.encode(text_chunks, show_progress_bar=True)
+    def build_rows(
+        self,
+        embeddings,
+        text_chunks: List[str],
+        document_id: str,
+        project_id,
+        offsets: List[int] | None = None,
+    ) -> List[dict]:
+        if offsets is None or len(offsets) != len(text_chunks):
+            offsets = [-1] * len(text_chunks)
 
-        print(f"Generating embeddings for {len(text_chunks)} chunks...")
-        data_to_insert = [
+        return [
             {
                 "vector": embedding.tolist(),
                 "text": chunk,
                 "document_id": document_id,
                 "project_id": project_id,
+                "chunk_index": index,
+                # The splitter reports -1 when it cannot locate a chunk
+                "start_offset": offset if offset >= 0 else None,
             }
-            for embedding, chunk in zip(embeddings, text_chunks)
+            for index, (embedding, chunk, offset) in enumerate(
+                zip(embeddings, text_chunks, offsets)
+            )
         ]
 
-        try:
-            self.table.add(data_to_insert)
-            print(
-                f"Successfully added {len(data_to_insert)} chunks for document_id: {document_id}"
+    def add(
+        self,
+        text_chunks: List[str],
+        document_id: str,
+        project_id,
+        offsets: List[int] | None = None,
+    ):
+        while True:
+            with self._lock:
+                model, table = self.model, self.table
+
+            if self._entry_exists(document_id, table):
+                print(f"Document {document_id} already exists in vector store. Skipping")
+                return None
+
+            embeddings = self.encode_batches(model, text_chunks)
+
+            print(f"Generating embeddings for {len(text_chunks)} chunks...")
+            data_to_insert = self.build_rows(
+                embeddings, text_chunks, document_id, project_id, offsets
             )
-        except Exception as e:
-            print(f"Error adding data to LanceDB: {e}")
+
+            # A migration only switches over under the write lock after
+            # checking every source document reached its table, so a write
+            # landing here is either seen by that check or lands after it.
+            with self._write_lock:
+                with self._lock:
+                    current, migration = self.table, self.migration
+                if current is table:
+                    try:
+                        table.add(data_to_insert)
+                        print(
+                            f"Successfully added {len(data_to_insert)} chunks for document_id: {document_id}"
+                        )
+                    except Exception as e:
+                        print(f"Error adding data to LanceDB: {e}")
+                        return None
+                    break
+
+            # The model switched while encoding; encode again with the new one
+            print(f"Embedding model changed, re-encoding document_id: {document_id}")
+
+        # Keep the migration target in step with new ingests
+        if migration is not None and migration.running:
+            migration.dual_write(text_chunks, document_id, project_id, offsets)
+
+    def _tables(self) -> list:
+        with self._lock:
+            tables = [self.table]
+            if self.migration is not None and self.migration.running:
+                tables.append(self.migration.table)
+        return tables
 
     def delete(self, document_id: str):
         try:
-            self.table.delete(f"document_id = '{document_id}'")
+            with self._write_lock:
+                for table in self._tables():
+                    table.delete(f"document_id = '{document_id}'")
             print(f"Successfully deleted entries for document_id: {document_id}")
         except Exception as e:
             print(f"Error deleting entries for document_id '{document_id}': {e}")
 
     def delete_many(self, project_id: str):
         try:
-            self.table.delete(f"project_id = '{project_id}'")
+            with self._write_lock:
+                for table in self._tables():
+                    table.delete(f"project_id = '{project_id}'")
             print(f"Successfully deleted all entries for project_id: {project_id}")
         except Exception as e:
             print(f"Error deleting entries for project_id '{project_id}': {e}")
 
     def search(self, query_text: str, project_id: str, limit: int = 5):
+        with self._lock:
+            model, table = self.model, self.table
+
+        start = time.perf_counter()
         try:
-            query_vector = self.model.encode(query_text)
+            query_vector = model.encode(query_text)
             results = (
-                self.table.search(query_vector)
+                table.search(query_vector)
                 .where(f"project_id = '{project_id}'")
                 .limit(limit)
                 .to_list()
@@ -95,6 +277,107 @@ class VectorStore:
             print(f"An error occured during the search: {e}")
             return []
 
+        finally:
+            self._query_latencies.append(
+                (time.monotonic(), (time.perf_counter() - start) * 1000)
+            )
+
+    def query_p99_ms(self) -> float | None:
+        # None when there have been no recent searches to protect
+        cutoff = time.monotonic() - LATENCY_WINDOW_SECONDS
+        latencies = sorted(
+            latency for at, latency in list(self._query_latencies) if at >= cutoff
+        )
+        if not latencies:
+            return None
+        return latencies[math.ceil(0.99 * len(latencies)) - 1]
+
+    def start_migration(
+        self,
+        model_name: str,
+        batch_size: int = 64,
+        p99_budget_ms: float = 500.0,
+        resume: bool = False,
+    ) -> EmbeddingMigration:
+        with self._lock:
+            if model_name == self.model_name:
+                raise ValueError(f"{model_name} is already the active model.")
+            # Differently spelled names can map to the same table, and the
+            # migration would then overwrite the table queries are using
+            if table_name_for(model_name) == self.table_name:
+                raise ValueError(
+                    f"{model_name} would use the active table {self.table_name}."
+                )
+            if self._migration_starting:
+                raise RuntimeError("A migration is already starting.")
+            if self.migration is not None and self.migration.running:
+                raise RuntimeError(
+                    f"A migration to {self.migration.model_name} is already running."
+                )
+            self._migration_starting = True
+
+        try:
+            migration = EmbeddingMigration(
+                self,
+                model_name,
+                batch_size=batch_size,
+                p99_budget_ms=p99_budget_ms,
+                resume=resume,
+            )
+        except Exception:
+            with self._lock:
+                self._migration_starting = False
+            raise
+
+        with self._lock:
+            self._migration_starting = False
+            self.migration = migration
+            self._save_state(
+                {
+                    "model": self.model_name,
+                    "target": model_name,
+                    "options": {
+                        "batch_size": batch_size,
+                        "p99_budget_ms": p99_budget_ms,
+                    },
+                }
+            )
+
+        migration.start()
+        return migration
+
+    def cancel_migration(self):
+        with self._lock:
+            migration = self.migration
+        if migration is None or not migration.running:
+            raise RuntimeError("No migration is running.")
+
+        migration.cancel()
+        if migration.state == "complete":
+            raise RuntimeError(
+                f"Migration to {migration.model_name} completed before it could be cancelled."
+            )
+        with self._lock:
+            self._save_state({"model": self.model_name})
+
+    def complete_migration(self, migration: EmbeddingMigration):
+        # Switch queries and ingests to the new model in one step. The old
+        # table is left in place so it can be inspected or dropped manually.
+        with self._lock:
+            previous = self.model_name
+            self._activate(migration.model_name, migration.model)
+            self._save_state({"model": self.model_name})
+        print(f"Switched embedding model from {previous} to {self.model_name}")
+
+    def migration_status(self) -> dict:
+        with self._lock:
+            status = {"model": self.model_name, "table": self.table_name}
+            migration = self.migration
+
+        status["query_p99_ms"] = self.query_p99_ms()
+        status["migration"] = migration.status() if migration is not None else None
+        return status
+
     def get_all(self, limit: int = 100):
         try:
             results = self.table.to_pandas().head(limit).to_dict("records")
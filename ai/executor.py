@@ -0,0 +1,218 @@
+import asyncio
+import functools
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+import torch
+
+
+def available_cpus() -> int:
+    """CPUs this process may actually use, honouring affinity and cgroup quotas."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    quota = None
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open("/sys/fs/cgroup/cpu.max", "r") as file:
+            limit, period = file.read().split()
+            if limit != "max":
+                quota = int(limit) / int(period)
+    except (OSError, ValueError):
+        try:
+            # cgroup v1
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "r") as file:
+                limit = int(file.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us", "r") as file:
+                period = int(file.read())
+            if limit > 0:
+                quota = limit / period
+        except (OSError, ValueError):
+            pass
+
+    if quota is not None:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return max(1, cpus)
+
+
+class _Pool:
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self._waits = deque(maxlen=512)
+        self._lock = threading.Lock()
+        # Notified whenever a task finishes so waiters can re-check depth
+        self.idle = threading.Condition(self._lock)
+
+    @property
+    def busy(self) -> bool:
+        return self.queued + self.running > 0
+
+    def wrap(self, fn, before=None):
+        submitted = time.perf_counter()
+        with self._lock:
+            self.queued += 1
+
+        def task():
+            if before is not None:
+                before()
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+                self._waits.append((time.perf_counter() - submitted) * 1000)
+            try:
+                return fn()
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+                    self.idle.notify_all()
+
+        return task
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = sorted(self._waits)
+            stats = {
+                "workers": self.workers,
+                "queued": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+            }
+
+        def percentile(p):
+            return waits[math.ceil(p * len(waits)) - 1] if waits else None
+
+        stats["wait_ms_p50"] = percentile(0.5)
+        stats["wait_ms_p99"] = percentile(0.99)
+        return stats
+
+
+class ExecutionPolicy:
+    """Routes blocking work onto separate query and ingest thread pools.
+
+    Interactive searches get their own pool so they never queue behind a
+    large ingest, and ingest work pauses between encode batches while any
+    query is queued or running. Torch's intra-op threads are split between
+    the ingests and migration backfill encoding at that moment, using the
+    CPUs actually available to the container, so concurrent bulk encodes
+    don't oversubscribe the cores while a lone ingest still gets them all.
+
+    Configured through the environment: EXECUTION_POLICY (set to 0 to fall
+    back to asyncio.to_thread), QUERY_WORKERS, INGEST_WORKERS, TORCH_THREADS
+    and INGEST_MAX_YIELD_SECONDS.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("EXECUTION_POLICY", "1") != "0"
+        self.cpus = available_cpus()
+        # Searches mostly wait on LanceDB, so size like the default executor
+        self.query_workers = int(
+            os.getenv("QUERY_WORKERS", min(32, self.cpus + 4))
+        )
+        self.ingest_workers = int(
+            os.getenv("INGEST_WORKERS", max(1, min(4, self.cpus // 2)))
+        )
+        # Upper bound on how long a single ingest batch waits for queries,
+        # so a steady stream of searches cannot starve ingest completely.
+        self.max_yield = float(os.getenv("INGEST_MAX_YIELD_SECONDS", 2.0))
+        # A fixed TORCH_THREADS disables the per-batch resizing below
+        self.fixed_torch_threads = os.getenv("TORCH_THREADS")
+        self.torch_threads = int(self.fixed_torch_threads or self.cpus)
+        # Reports whether a migration backfill is encoding; set by the app
+        self._background_active: Callable[[], bool] = lambda: False
+
+        self.query_pool = _Pool("query", self.query_workers)
+        self.ingest_pool = _Pool("ingest", self.ingest_workers)
+
+        if self.enabled:
+            self._configure_torch()
+
+    def _configure_torch(self):
+        torch.set_num_threads(self.torch_threads)
+        try:
+            # Only allowed before any inter-op parallel work has started
+            torch.set_num_interop_threads(1)
+        except RuntimeError as e:
+            print(f"Could not set torch inter-op threads: {e}")
+        print(
+            f"Execution policy: {self.cpus} CPUs, {self.torch_threads} torch threads, "
+            f"{self.query_workers} query / {self.ingest_workers} ingest workers"
+        )
+
+    def watch_background(self, is_active: Callable[[], bool]):
+        """Count a migration backfill as a bulk encoder while is_active()."""
+        self._background_active = is_active
+
+    def _resize_torch_threads(self):
+        # Query encodes are a single short sentence and mostly wait on I/O,
+        # so only bulk encoders (ingests and the backfill) split the cores.
+        if self.fixed_torch_threads:
+            return
+        encoders = self.ingest_pool.running + (1 if self._background_active() else 0)
+        threads = max(1, self.cpus // max(1, encoders))
+        if threads != self.torch_threads:
+            self.torch_threads = threads
+            torch.set_num_threads(threads)
+
+    def yield_to_queries(self):
+        """Block the calling ingest thread while queries are pending.
+
+        Called before every bulk encode batch, which is also when the torch
+        thread count is adjusted to the number of bulk encoders running.
+        """
+        if not self.enabled:
+            return
+        self._resize_torch_threads()
+        deadline = time.monotonic() + self.max_yield
+        with self.query_pool.idle:
+            while self.query_pool.busy:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                self.query_pool.idle.wait(remaining)
+
+    async def _run(self, pool: _Pool, fn, args, kwargs, before=None):
+        call = functools.partial(fn, *args, **kwargs)
+        if not self.enabled:
+            return await asyncio.to_thread(call)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(pool.executor, pool.wrap(call, before))
+
+    async def run_query(self, fn, *args, **kwargs):
+        return await self._run(self.query_pool, fn, args, kwargs)
+
+    async def run_ingest(self, fn, *args, **kwargs):
+        return await self._run(
+            self.ingest_pool, fn, args, kwargs, before=self.yield_to_queries
+        )
+
+    async def run_maintenance(self, fn, *args, **kwargs):
+        """Run deletes, debug dumps and migration starts on the default executor.
+
+        They are neither interactive searches (ingest should not yield to
+        them) nor something that should wait behind a large ingest.
+        """
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "cpus": self.cpus,
+            "background_encoding": self._background_active(),
+            "torch_threads": torch.get_num_threads(),
+            "torch_interop_threads": torch.get_num_interop_threads(),
+            "query": self.query_pool.stats(),
+            "ingest": self.ingest_pool.stats(),
+        }
@@ -1,15 +1,19 @@
-import asyncio
 from typing import List
 
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, status
 
+from context import ContextAssembler
 from db.vector import VectorStore
-from models import FileAPIResponse
+from executor import ExecutionPolicy
+from models import FileAPIResponse, MigrationAPIRequest
 from reader import FileProcessor
 
 load_dotenv()
-vs = VectorStore()
+# Must be created before the model loads so torch thread counts apply
+policy = ExecutionPolicy()
+vs = VectorStore(pause=policy.yield_to_queries)
+policy.watch_background(lambda: vs.migration is not None and vs.migration.running)
 app = FastAPI()
 
 
@@ -42,7 +46,12 @@ def _process_file_sync(
         raise ValueError("Failed to chunk data.")
 
     # 3. Add chunks to the vector store
-    vs.add(chunks, document_id=document_id, project_id=project_id)
+    vs.add(
+        chunks,
+        document_id=document_id,
+        project_id=project_id,
+        offsets=fp.chunk_offsets,
+    )
 
     return document_id
 
@@ -88,8 +97,8 @@ async def read_process(jsonBody: FileAPIResponse):
         if jsonBody.content:
             content_bytes = base64.b64decode(jsonBody.content)
 
-        # Run the synchronous pipeline in a worker thread
-        document_id = await asyncio.to_thread(
+        # Run the synchronous pipeline on the ingest pool
+        document_id = await policy.run_ingest(
             _process_file_sync,
             document_id=jsonBody.document_id,
             project_id=jsonBody.project_id,
@@ -158,7 +167,7 @@ async def get_vector(query, project_id):
         )
 
     try:
-        data = await asyncio.to_thread(_vector_query_sync, query, project_id)
+        data = await policy.run_query(_vector_query_sync, query, project_id)
         print(data)
         return {"text": data}
     except ValueError as e:
@@ -168,6 +177,50 @@ async def get_vector(query, project_id):
         )
 
 
+def _context_query_sync(
+    query: str, project_id: str, token_budget: int, limit: int
+) -> dict:
+    try:
+        results = vs.search(query, project_id, limit=limit)
+        return ContextAssembler(token_budget).assemble(results)
+    except Exception as e:
+        raise ValueError(f"Context assembly failure: {e}")
+
+
+@app.get("/api/context")
+async def get_context(query, project_id, token_budget: int = 1024, limit: int = 20):
+    if not query:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Query not specified!",
+            headers={"X-Error": "No query"},
+        )
+
+    if not project_id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Project ID not specified!",
+            headers={"X-Error": "No project id specified"},
+        )
+
+    if token_budget <= 0 or limit <= 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Token budget and limit must be positive!",
+            headers={"X-Error": "Invalid context parameters"},
+        )
+
+    try:
+        return await policy.run_query(
+            _context_query_sync, query, project_id, token_budget, limit
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Context assembly failure: {e}",
+        )
+
+
 @app.delete("/api/vector")
 async def delete_vector_embeddings(project_id: str):
     if not project_id:
@@ -178,7 +231,7 @@ async def delete_vector_embeddings(project_id: str):
         )
 
     try:
-        await asyncio.to_thread(vs.delete_many, project_id)
+        await policy.run_maintenance(vs.delete_many, project_id)
         return {
             "message": f"Successfully deleted all vector embeddings for project: {project_id}"
         }
@@ -189,10 +242,81 @@ async def delete_vector_embeddings(project_id: str):
         )
 
 
+@app.post("/api/migration")
+async def start_migration(jsonBody: MigrationAPIRequest):
+    if not jsonBody.model:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Model not specified!",
+            headers={"X-Error": "No model specified"},
+        )
+
+    if jsonBody.batch_size <= 0 or jsonBody.p99_budget_ms <= 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Batch size and p99 budget must be positive!",
+            headers={"X-Error": "Invalid migration parameters"},
+        )
+
+    try:
+        # Loading the new model can take a while, keep it off the event loop
+        migration = await policy.run_maintenance(
+            vs.start_migration,
+            jsonBody.model,
+            batch_size=jsonBody.batch_size,
+            p99_budget_ms=jsonBody.p99_budget_ms,
+        )
+        return {
+            "message": f"Started migration to embedding model: {jsonBody.model}",
+            "migration": migration.status(),
+        }
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e),
+            headers={"X-Error": "Invalid migration"},
+        )
+    except RuntimeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e),
+            headers={"X-Error": "Migration already running"},
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to start migration: {e}",
+        )
+
+
+@app.get("/api/migration")
+async def get_migration():
+    return vs.migration_status()
+
+
+@app.delete("/api/migration")
+async def cancel_migration():
+    try:
+        # Waits for the backfill thread to stop, keep it off the event loop
+        await policy.run_maintenance(vs.cancel_migration)
+        return {"message": "Migration cancelled"}
+    except RuntimeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e),
+            headers={"X-Error": "Migration not running"},
+        )
+
+
+@app.get("/api/debug/executor")
+async def get_executor_stats():
+    return policy.stats()
+
+
 @app.get("/api/debug/embeddings")
 async def get_all_embeddings(limit: int = 100):
     try:
-        embeddings = await asyncio.to_thread(vs.get_all, limit)
+        embeddings = await policy.run_maintenance(vs.get_all, limit)
         return {"count": len(embeddings), "embeddings": embeddings}
     except Exception as e:
         raise HTTPException(
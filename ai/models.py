@@ -26,3 +26,9 @@ class FileAPIResponse(BaseModel):
 class VectorAPIResponse(BaseModel):
     query: str
     project_id: str
+
+
+class MigrationAPIRequest(BaseModel):
+    model: str  # SentenceTransformer model name to migrate to
+    batch_size: int = 64  # Chunks re-encoded between throttle checks
+    p99_budget_ms: float = 500.0  # Backfill backs off above this query p99
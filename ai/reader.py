@@ -15,6 +15,7 @@ class FileProcessor:
         self.content = content  # Raw bytes content
         self.filename = filename  # Original filename for content-based processing
         self.data = None
+        self.chunk_offsets: List[int] = []  # Start offset of each chunk in data
 
     # This only works for text-based PDFs.
     def _process_pdf(self):
@@ -106,10 +107,14 @@ class FileProcessor:
                 separators=separators
                 if separators is not None
                 else ["\n\n", "\n", " ", ""],
+                add_start_index=True,
             )
 
-            # Split the text
-            chunks = text_splitter.split_text(self.data)
+            # Split the text, keeping each chunk's position in the document
+            # so overlapping hits can be stitched back together at query time
+            documents = text_splitter.create_documents([self.data])
+            chunks = [doc.page_content for doc in documents]
+            self.chunk_offsets = [doc.metadata["start_index"] for doc in documents]
 
             # Ensure we return None instead of empty list for consistency
             if not chunks:
@@ -6,14 +6,16 @@ export const maxDuration = 30;
 const env = process.env.NODE_ENV;
 const ollamaEndpoint =
   env == "production" ? OLLAMA_ENDPOINT : "http://localhost:11434";
+// Approximate token budget for retrieved context sent to the model
+const CONTEXT_TOKEN_BUDGET = 1024;
 
-async function fetchVectorEmbeddings(
+async function fetchContext(
   query: string,
   projectId: string,
 ): Promise<string[]> {
   try {
     const response = await fetch(
-      `${FASTAPI_ENDPOINT}/api/vector?query=${query}&project_id=${projectId}`,
+      `${FASTAPI_ENDPOINT}/api/context?query=${encodeURIComponent(query)}&project_id=${encodeURIComponent(projectId)}&token_budget=${CONTEXT_TOKEN_BUDGET}`,
       {
         method: "GET",
         headers: {
@@ -27,7 +29,7 @@ async function fetchVectorEmbeddings(
     if (!response.ok) {
       const { error } = await response.json();
       console.error(
-        `[${response.status}] Failed to fetch embeddings: ${error}`,
+        `[${response.status}] Failed to fetch context: ${error}`,
       );
       return [];
     }
@@ -35,7 +37,7 @@ async function fetchVectorEmbeddings(
     const data = await response.json();
     return data.text || [];
   } catch (error) {
-    console.error("Error fetching vector embeddings:", error);
+    console.error("Error fetching context:", error);
     return [];
   }
 }
@@ -67,7 +69,7 @@ export async function POST(req: Request) {
     // Fetch relevant context from vector store if we have both message and project_id
     const contextMessages: UIMessage[] = [];
     if (lastMessageText && project_id) {
-      const topHits = await fetchVectorEmbeddings(lastMessageText, project_id);
+      const topHits = await fetchContext(lastMessageText, project_id);
 
       if (topHits.length > 0) {
         // Add context as a system message with parts for each hit